@@ -1,8 +1,11 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import feedparser
-from datetime import datetime
+import orjson
+from types import MappingProxyType
 import re
 
 # ============================================================
@@ -14,7 +17,10 @@ st.set_page_config(
 )
 
 # Custom Styling
-st.markdown("""
+@st.cache_resource
+def _inject_css():
+    # Cached so reruns replay the stored element instead of re-running markdown
+    st.markdown("""
 <style>
 
 .block-container {
@@ -39,30 +45,75 @@ h2, h3 {
 """, unsafe_allow_html=True)
 
 
+_inject_css()
+
+
+# ============================================================
+# Shared HTTP session (connection pooling + retries)
+# ============================================================
+@st.cache_resource
+def _get_session():
+    # Cached so the pool survives Streamlit reruns of this script
+    session = requests.Session()
+    session.headers.update({"User-Agent": "Mozilla/5.0"})
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=10,
+        max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ))
+    return session
+
+
+_session = _get_session()
+
+
 # ============================================================
 # Helper functions
 # ============================================================
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
 def clean_html(text):
     if not text:
         return ""
-    clean = re.sub('<.*?>', '', text)
-    return clean.strip()
+    if '<' not in text:
+        return text.strip()
+    return _TAG_RE.sub('', text).strip()
 
 
-def parse_date(date_str: str):
-    if not date_str:
-        return None
-    for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
-        try:
-            return datetime.strptime(date_str, fmt)
-        except:
-            pass
-    return None
+_EMPTY = MappingProxyType({})
+
+
+def dig(d, *keys, default=""):
+    # Walk nested dicts; missing or null levels collapse to an empty mapping
+    for k in keys[:-1]:
+        d = d.get(k) or _EMPTY
+    return d.get(keys[-1]) or default
 
 
 # ============================================================
 # Fetch trials using API v2
 # ============================================================
+# Only request the fields the app reads, to keep the payload small
+TRIAL_FIELDS = ",".join([
+    "protocolSection.identificationModule.nctId",
+    "protocolSection.identificationModule.officialTitle",
+    "protocolSection.identificationModule.briefTitle",
+    "protocolSection.statusModule.overallStatus",
+    "protocolSection.statusModule.startDateStruct.date",
+    "protocolSection.statusModule.studyFirstPostDateStruct.date",
+    "protocolSection.statusModule.lastUpdatePostDateStruct.date",
+    "protocolSection.sponsorCollaboratorsModule.leadSponsor.name",
+    "protocolSection.conditionsModule.conditions",
+    "protocolSection.designModule.phases",
+    "protocolSection.armsInterventionsModule.interventions.name",
+    "protocolSection.contactsLocationsModule.locations.city",
+    "protocolSection.contactsLocationsModule.locations.state",
+    "protocolSection.contactsLocationsModule.locations.country",
+])
+
+
+@st.cache_data(ttl=600, show_spinner=False)
 def fetch_trials(expr: str, max_rnk: int = 100):
     url = "https://clinicaltrials.gov/api/v2/studies"
 
@@ -70,65 +121,88 @@ def fetch_trials(expr: str, max_rnk: int = 100):
         "format": "json",
         "query.term": expr,
         "pageSize": max_rnk,
+        "fields": TRIAL_FIELDS,
     }
 
-    resp = requests.get(url, params=params, timeout=20)
+    resp = _session.get(url, params=params, timeout=20)
     resp.raise_for_status()
-    data = resp.json()
+    data = orjson.loads(resp.content)
 
-    rows = []
+    # One list per output column; the DataFrame is built column-wise below
+    nct_ids, titles, interventions_col, conditions_col, phases_col = [], [], [], [], []
+    statuses, sponsors, start_dates, first_posts, last_updates = [], [], [], [], []
+    cities, states, countries = [], [], []
 
     for s in data.get("studies", []):
-        protocol = s.get("protocolSection", {})
+        protocol = s.get("protocolSection") or _EMPTY
 
-        ident = protocol.get("identificationModule", {})
-        status = protocol.get("statusModule", {})
-        sponsor = protocol.get("sponsorCollaboratorsModule", {})
-        conditions = protocol.get("conditionsModule", {})
-        design = protocol.get("designModule", {})
-        arms = protocol.get("armsInterventionsModule", {})
-        locs = protocol.get("contactsLocationsModule", {})
+        ident = protocol.get("identificationModule") or _EMPTY
+        status = protocol.get("statusModule") or _EMPTY
 
         nct = ident.get("nctId", "")
         title = ident.get("officialTitle") or ident.get("briefTitle") or ""
 
-        interventions = [inv["name"] for inv in arms.get("interventions", []) if "name" in inv]
-        condition_list = conditions.get("conditions") or []
-        phase_list = design.get("phases") or []
-
-        start_date = status.get("startDateStruct", {}).get("date", "")
-        first_post = status.get("studyFirstPostDateStruct", {}).get("date", "")
-        last_update = status.get("lastUpdatePostDateStruct", {}).get("date", "")
-
-        sponsor_name = sponsor.get("leadSponsor", {}).get("name", "")
-
-        loc_list = locs.get("locations", []) or []
-        city = loc_list[0].get("city", "") if loc_list else ""
-        state = loc_list[0].get("state", "") if loc_list else ""
-        country = loc_list[0].get("country", "") if loc_list else ""
-
-        rows.append({
-            "NCT ID": nct,
-            "Title": title,
-            "Intervention / Drug": ", ".join(interventions),
-            "Condition": ", ".join(condition_list),
-            "Phase": ", ".join(phase_list),
-            "Status": status.get("overallStatus", ""),
-            "Sponsor": sponsor_name,
-            "Start Date": start_date,
-            "First Posted": first_post,
-            "Last Updated": last_update,
-            "City": city,
-            "State": state,
-            "Country": country,
-            "CT Link": f"https://clinicaltrials.gov/study/{nct}",
-            "_LastUpdated_dt": parse_date(last_update),
-        })
-
-    df = pd.DataFrame(rows)
+        inv_list = dig(protocol, "armsInterventionsModule", "interventions", default=())
+        interventions = [inv["name"] for inv in inv_list if "name" in inv]
+        condition_list = dig(protocol, "conditionsModule", "conditions", default=[])
+        phase_list = dig(protocol, "designModule", "phases", default=[])
 
+        try:
+            start_date = status["startDateStruct"]["date"]
+            first_post = status["studyFirstPostDateStruct"]["date"]
+            last_update = status["lastUpdatePostDateStruct"]["date"]
+        except (KeyError, TypeError):
+            # Missing or null date structs
+            start_date = dig(status, "startDateStruct", "date")
+            first_post = dig(status, "studyFirstPostDateStruct", "date")
+            last_update = dig(status, "lastUpdatePostDateStruct", "date")
+
+        sponsor_name = dig(protocol, "sponsorCollaboratorsModule", "leadSponsor", "name")
+
+        loc_list = dig(protocol, "contactsLocationsModule", "locations", default=())
+        first_loc = loc_list[0] if loc_list else _EMPTY
+        city = first_loc.get("city", "")
+        state = first_loc.get("state", "")
+        country = first_loc.get("country", "")
+
+        nct_ids.append(nct)
+        titles.append(title)
+        # Raw lists; joined only for the trial that is displayed
+        interventions_col.append(interventions)
+        conditions_col.append(condition_list)
+        phases_col.append(phase_list)
+        statuses.append(status.get("overallStatus", ""))
+        sponsors.append(sponsor_name)
+        start_dates.append(start_date)
+        first_posts.append(first_post)
+        last_updates.append(last_update)
+        cities.append(city)
+        states.append(state)
+        countries.append(country)
+
+    # Truncated titles for the selection list, computed once per fetch
+    display_titles = [t[:65] + ("…" if len(t) > 65 else "") for t in titles]
+
+    df = pd.DataFrame({
+        "NCT ID": nct_ids,
+        "Title": titles,
+        "_display_title": display_titles,
+        "Intervention / Drug": interventions_col,
+        "Condition": conditions_col,
+        "Phase": phases_col,
+        "Status": statuses,
+        "Sponsor": sponsors,
+        "Start Date": start_dates,
+        "First Posted": first_posts,
+        "Last Updated": last_updates,
+        "City": cities,
+        "State": states,
+        "Country": countries,
+    })
+
+    # ISO dates sort correctly as strings; empty dates fall to the end
     if not df.empty:
-        df = df.sort_values(by="_LastUpdated_dt", ascending=False)
+        df = df.sort_values(by="Last Updated", ascending=False, kind="stable")
 
     return df
 
@@ -136,7 +210,78 @@ def fetch_trials(expr: str, max_rnk: int = 100):
 # ============================================================
 # Fetch Related News Articles
 # ============================================================
+import io
 import urllib.parse
+from xml.etree import ElementTree as ET
+
+# Number of articles shown per trial
+NEWS_ITEMS = 5
+
+
+def _first_items(xml_bytes: bytes, limit: int = NEWS_ITEMS):
+    # Stream the RSS and stop after `limit` <item> elements. The input may be
+    # a truncated prefix of the feed, so keep whatever parsed before the cut.
+    articles = []
+    try:
+        for _, el in ET.iterparse(io.BytesIO(xml_bytes), events=("end",)):
+            if el.tag.endswith("item"):
+                articles.append({
+                    "title": el.findtext("title") or "",
+                    "link": el.findtext("link") or "",
+                    "published": el.findtext("pubDate") or "",
+                    "summary": clean_html(el.findtext("description") or "")[:260],
+                })
+                el.clear()
+                if len(articles) == limit:
+                    break
+    except ET.ParseError:
+        pass
+    return articles
+
+
+def _read_feed_prefix(resp, n_items: int = NEWS_ITEMS, max_bytes: int = 64_000):
+    # Keep only as much of the body as needed to hold the first `n_items`
+    buf = bytearray()
+    found = 0
+    for chunk in resp.iter_content(8192):
+        # Rescan only the new chunk plus enough overlap for a split tag
+        start = max(len(buf) - 6, 0)
+        buf.extend(chunk)
+        found += buf.count(b"</item>", start)
+        if found >= n_items or len(buf) > max_bytes:
+            break
+    return bytes(buf)
+
+
+@st.cache_data(ttl=1800, show_spinner=False)
+def _fetch_news_rss(query_encoded: str):
+    # Bing News RSS (very reliable on Streamlit Cloud)
+    url = f"https://www.bing.com/news/search?q={query_encoded}&format=rss"
+
+    # Closing the response early drops the connection instead of pooling it;
+    # that is the accepted cost of not downloading the rest of the feed
+    with _session.get(url, timeout=10, stream=True) as resp:
+        resp.raise_for_status()
+        xml_bytes = _read_feed_prefix(resp)
+
+    articles = _first_items(xml_bytes)
+    if articles:
+        return articles
+
+    # Fall back to feedparser for feeds the fast path can't handle
+    feed = feedparser.parse(xml_bytes)
+    for entry in feed.entries[:NEWS_ITEMS]:
+        summary_raw = entry.get("summary", "")
+        summary = clean_html(summary_raw)[:260] if summary_raw else ""
+        articles.append({
+            "title": entry.get("title", ""),
+            "link": entry.get("link", ""),
+            "published": entry.get("published", ""),
+            "summary": summary,
+        })
+
+    return articles
+
 
 def fetch_articles(drug_term: str, condition_term: str = ""):
     # Build search string
@@ -154,32 +299,12 @@ def fetch_articles(drug_term: str, condition_term: str = ""):
     # Encode safely for URL
     query_encoded = urllib.parse.quote_plus(query)
 
-    # Bing News RSS (very reliable on Streamlit Cloud)
-    url = f"https://www.bing.com/news/search?q={query_encoded}&format=rss"
-
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
-
+    # Failed fetches raise inside the cached helper, so they are not cached
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        feed = feedparser.parse(resp.text)
-    except:
+        return _fetch_news_rss(query_encoded)
+    except requests.RequestException:
         return []
 
-    articles = []
-    for entry in feed.entries[:5]:
-        summary = clean_html(getattr(entry, "summary", ""))[:260]
-        articles.append({
-            "title": entry.title,
-            "link": entry.link,
-            "published": getattr(entry, "published", ""),
-            "summary": summary,
-        })
-
-    return articles
-
 
 
 
@@ -221,6 +346,8 @@ if df.empty:
     st.stop()
 
 df = df.head(display_n)
+records = df.to_dict("records")
+nct_to_idx = {r["NCT ID"]: i for i, r in enumerate(records)}
 
 
 # ============================================================
@@ -234,15 +361,14 @@ col1, col2 = st.columns([1.3, 2])
 with col1:
     st.subheader("Select a Trial")
 
-    options = [
-        f"{row['NCT ID']} — {row['Title'][:65]}{'…' if len(row['Title']) > 65 else ''}"
-        for _, row in df.iterrows()
-    ]
+    ncts = df["NCT ID"].to_numpy()
+    display_titles = df["_display_title"].to_numpy()
+    options = [f"{n} — {d}" for n, d in zip(ncts, display_titles)]
 
     selected_label = st.radio("", options, index=0)
     selected_nct = selected_label.split(" — ")[0]
 
-    selected_row = df[df["NCT ID"] == selected_nct].iloc[0]
+    selected_row = records[nct_to_idx[selected_nct]]
 
 
 # ------------------------------------------------------------
@@ -255,9 +381,14 @@ with col2:
 
     st.markdown(f"### {row['Title']}")
 
-    st.write(f"**Drug / Intervention:** {row['Intervention / Drug'] or '—'}")
-    st.write(f"**Condition(s):** {row['Condition'] or '—'}")
-    st.write(f"**Phase:** {row['Phase'] or '—'}")
+    drug = ", ".join(row["Intervention / Drug"])
+    condition = ", ".join(row["Condition"])
+    phase = ", ".join(row["Phase"])
+    ct_link = f"https://clinicaltrials.gov/study/{row['NCT ID']}"
+
+    st.write(f"**Drug / Intervention:** {drug or '—'}")
+    st.write(f"**Condition(s):** {condition or '—'}")
+    st.write(f"**Phase:** {phase or '—'}")
     st.write(f"**Status:** {row['Status'] or '—'}")
     st.write(f"**Sponsor:** {row['Sponsor'] or '—'}")
 
@@ -269,7 +400,7 @@ with col2:
     if location:
         st.write(f"**Location:** {location}")
 
-    st.markdown(f"[View Full Study ➜]({row['CT Link']})")
+    st.markdown(f"[View Full Study ➜]({ct_link})")
 
     st.write("---")
 
@@ -277,7 +408,7 @@ with col2:
     st.subheader("Related Articles")
 
     with st.spinner("Loading articles…"):
-        articles = fetch_articles(row["Intervention / Drug"], row["Condition"])
+        articles = fetch_articles(drug, condition)
 
     if not articles:
         st.write("No recent news found.")